@@ -3,21 +3,20 @@ Agent namespaced tasks
 """
 
 
-import ast
-import datetime
-import glob
 import os
 import re
+import shlex
 import shutil
+import subprocess
 import sys
-from distutils.dir_util import copy_tree
+from concurrent.futures import ThreadPoolExecutor
 
 from invoke import task
 from invoke.exceptions import Exit, ParseError
 
 from .build_tags import filter_incompatible_tags, get_build_tags, get_default_build_tags
 from .docker import pull_base_images
-from .go import deps, generate
+from .go import deps, generate, generate_needed
 from .rtloader import clean as rtloader_clean
 from .rtloader import install as rtloader_install
 from .rtloader import make as rtloader_make
@@ -34,10 +33,19 @@ from .utils import (
     load_release_versions,
 )
 
+# Raise shutil's copy buffer from the 64 KiB default: larger aggregated reads
+# mean fewer syscalls when a copy cannot use a kernel fast path (reflink,
+# sendfile) and has to move bytes through userspace.
+shutil.COPY_BUFSIZE = 4 * 1024 * 1024
+
 # constants
 BIN_PATH = os.path.join(".", "bin", "agent")
 AGENT_TAG = "datadog/agent:master"
 
+# omnibus version sanitizing patterns, precompiled for the version task
+OMNIBUS_VERSION_DASH_RE = re.compile('-')
+OMNIBUS_VERSION_INVALID_CHAR_RE = re.compile(r'[^a-zA-Z0-9\.\+\:\~]+')
+
 AGENT_CORECHECKS = [
     "containerd",
     "cpu",
@@ -74,6 +82,59 @@ IOT_AGENT_CORECHECKS = [
 ]
 
 
+# FICLONE ioctl request number, from linux/fs.h
+_FICLONE = 0x40049409
+
+# clonefile(2) from libSystem, lazily loaded on macOS
+_clonefile = None
+
+
+def _reflink_copy(src, dst):
+    """
+    Copy a single file, cloning it instead of copying its blocks when the
+    filesystem supports reflinks (APFS on macOS, btrfs/XFS on Linux). The
+    clone is O(1) in file size; filesystems without clone support fall back
+    to a regular copy.
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    try:
+        if sys.platform == 'darwin':
+            import ctypes
+            from ctypes.util import find_library
+
+            global _clonefile
+            if _clonefile is None:
+                _clonefile = ctypes.CDLL(find_library("System"), use_errno=True).clonefile
+            # clonefile refuses to overwrite an existing destination
+            if os.path.exists(dst):
+                os.unlink(dst)
+            if _clonefile(src.encode(), dst.encode(), 0) != 0:
+                raise OSError(ctypes.get_errno(), "clonefile failed")
+        elif sys.platform.startswith('linux'):
+            import fcntl
+
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            shutil.copymode(src, dst)
+        else:
+            return shutil.copy(src, dst)
+    except OSError:
+        return shutil.copy(src, dst)
+    return dst
+
+
+def _copytree(src, dst):
+    """
+    Copy a directory tree on top of dst, creating it if needed.
+
+    Unlike the deprecated distutils.dir_util.copy_tree, shutil.copytree walks
+    the source with os.scandir and reuses its cached stat results, avoiding
+    redundant stat() syscalls on every file.
+    """
+    shutil.copytree(src, dst, copy_function=_reflink_copy, dirs_exist_ok=True)
+
+
 @task
 def build(
     ctx,
@@ -103,12 +164,32 @@ def build(
         inv agent.build --build-exclude=systemd
     """
 
-    if not exclude_rtloader and not iot:
+    def build_rtloader():
         # If embedded_path is set, we should give it to rtloader as it should install the headers/libs
         # in the embedded path folder because that's what is used in get_build_flags()
         rtloader_make(ctx, python_runtimes=python_runtimes, install_prefix=embedded_path)
         rtloader_install(ctx)
 
+    # The rtloader build and go generate are independent of each other, so the
+    # rtloader stream runs in a worker thread while generate runs here. Both
+    # only spawn subprocesses, so a thread is enough to overlap them.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        rtloader_future = None
+        if not exclude_rtloader and not iot:
+            rtloader_future = pool.submit(build_rtloader)
+
+        # Generating go source from templates by running go generate on ./pkg/status.
+        # Skipped when the templates are unchanged, to avoid rewriting the generated
+        # files and invalidating go's build cache for their dependents.
+        if generate_needed():
+            generate(ctx)
+        else:
+            print("go generate skipped (generated code is up to date)")
+
+        # rtloader must be installed before get_build_flags queries it
+        if rtloader_future is not None:
+            rtloader_future.result()
+
     ldflags, gcflags, env = get_build_flags(
         ctx,
         embedded_path=embedded_path,
@@ -163,9 +244,6 @@ def build(
         build_exclude = [] if build_exclude is None else build_exclude.split(",")
         build_tags = get_build_tags(build_include, build_exclude)
 
-    # Generating go source from templates by running go generate on ./pkg/status
-    generate(ctx)
-
     cmd = "go build -mod={go_mod} {race_opt} {build_type} -tags \"{go_build_tags}\" "
 
     cmd += "-o {agent_bin} -gcflags=\"{gcflags}\" -ldflags=\"{ldflags}\" {REPO_PATH}/cmd/{flavor}"
@@ -216,35 +294,55 @@ def refresh_assets(_, build_tags, development=True, iot=False, windows_sysprobe=
         shutil.rmtree(dist_folder)
     os.mkdir(dist_folder)
 
+    # Copies are independent and I/O-bound, so they are collected first and
+    # dispatched to a thread pool to overlap directory walks and writes. The
+    # single-file batch runs after the tree batch, which creates conf.d.
+    tree_copies = []
+    file_copies = []
+
     if "python" in build_tags:
-        copy_tree("./cmd/agent/dist/checks/", os.path.join(dist_folder, "checks"))
-        copy_tree("./cmd/agent/dist/utils/", os.path.join(dist_folder, "utils"))
-        shutil.copy("./cmd/agent/dist/config.py", os.path.join(dist_folder, "config.py"))
+        tree_copies.append(("./cmd/agent/dist/checks/", os.path.join(dist_folder, "checks")))
+        tree_copies.append(("./cmd/agent/dist/utils/", os.path.join(dist_folder, "utils")))
+        file_copies.append(("./cmd/agent/dist/config.py", os.path.join(dist_folder, "config.py")))
     if not iot:
-        shutil.copy("./cmd/agent/dist/dd-agent", os.path.join(dist_folder, "dd-agent"))
-        # copy the dd-agent placeholder to the bin folder
+        # copy the dd-agent placeholder directly to the bin folder; copyfile
+        # takes the zero-copy sendfile path on Linux, copymode keeps the
+        # executable bit
         bin_ddagent = os.path.join(BIN_PATH, "dd-agent")
-        shutil.move(os.path.join(dist_folder, "dd-agent"), bin_ddagent)
+        shutil.copyfile("./cmd/agent/dist/dd-agent", bin_ddagent)
+        shutil.copymode("./cmd/agent/dist/dd-agent", bin_ddagent)
 
     # System probe not supported on windows
     if sys.platform.startswith('linux') or windows_sysprobe:
-        shutil.copy("./cmd/agent/dist/system-probe.yaml", os.path.join(dist_folder, "system-probe.yaml"))
-    shutil.copy("./cmd/agent/dist/datadog.yaml", os.path.join(dist_folder, "datadog.yaml"))
+        file_copies.append(("./cmd/agent/dist/system-probe.yaml", os.path.join(dist_folder, "system-probe.yaml")))
+    file_copies.append(("./cmd/agent/dist/datadog.yaml", os.path.join(dist_folder, "datadog.yaml")))
 
     for check in AGENT_CORECHECKS if not iot else IOT_AGENT_CORECHECKS:
         check_dir = os.path.join(dist_folder, "conf.d/{}.d/".format(check))
-        copy_tree("./cmd/agent/dist/conf.d/{}.d/".format(check), check_dir)
+        tree_copies.append(("./cmd/agent/dist/conf.d/{}.d/".format(check), check_dir))
     if "apm" in build_tags:
-        shutil.copy("./cmd/agent/dist/conf.d/apm.yaml.default", os.path.join(dist_folder, "conf.d/apm.yaml.default"))
+        file_copies.append(
+            ("./cmd/agent/dist/conf.d/apm.yaml.default", os.path.join(dist_folder, "conf.d/apm.yaml.default"))
+        )
     if "process" in build_tags:
-        shutil.copy(
-            "./cmd/agent/dist/conf.d/process_agent.yaml.default",
-            os.path.join(dist_folder, "conf.d/process_agent.yaml.default"),
+        file_copies.append(
+            (
+                "./cmd/agent/dist/conf.d/process_agent.yaml.default",
+                os.path.join(dist_folder, "conf.d/process_agent.yaml.default"),
+            )
         )
 
-    copy_tree("./cmd/agent/gui/views", os.path.join(dist_folder, "views"))
+    tree_copies.append(("./cmd/agent/gui/views", os.path.join(dist_folder, "views")))
+
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 4)) as pool:
+        # Consume the iterators to surface any copy error raised in a worker
+        list(pool.map(lambda copy: _copytree(*copy), tree_copies))
+        list(pool.map(lambda copy: shutil.copy(*copy), file_copies))
+
+    # dev/dist is copied last: in development mode it overrides files shipped
+    # by the copies above, so it cannot be part of the parallel batch.
     if development:
-        copy_tree("./dev/dist/", dist_folder)
+        _copytree("./dev/dist/", dist_folder)
 
 
 @task
@@ -274,6 +372,8 @@ def image_build(ctx, arch='amd64', base_dir="omnibus", python_version="2", skip_
     """
     Build the docker image
     """
+    import fnmatch
+
     BOTH_VERSIONS = ["both", "2+3"]
     VALID_VERSIONS = ["2", "3"] + BOTH_VERSIONS
     if python_version not in VALID_VERSIONS:
@@ -284,14 +384,33 @@ def image_build(ctx, arch='amd64', base_dir="omnibus", python_version="2", skip_
     pkg_dir = os.path.join(base_dir, 'pkg')
     deb_glob = 'datadog-agent*_{}.deb'.format(arch)
     dockerfile_path = "{}/{}/Dockerfile".format(build_context, arch)
-    list_of_files = glob.glob(os.path.join(pkg_dir, deb_glob))
-    # get the last debian package built
-    if not list_of_files:
+    # get the last debian package built, in a single scandir pass: the
+    # DirEntry stat results are cached, so each package is stat-ed once
+    # instead of being re-stat-ed by glob and then by getctime
+    latest_file = None
+    latest_ctime = -1
+    if os.path.isdir(pkg_dir):
+        with os.scandir(pkg_dir) as entries:
+            for entry in entries:
+                if fnmatch.fnmatch(entry.name, deb_glob):
+                    ctime = entry.stat().st_ctime
+                    if ctime > latest_ctime:
+                        latest_file, latest_ctime = entry.path, ctime
+    if latest_file is None:
         print("No debian package build found in {}".format(pkg_dir))
         print("See agent.omnibus-build")
         raise Exit(code=1)
-    latest_file = max(list_of_files, key=os.path.getctime)
-    shutil.copy2(latest_file, build_context)
+
+    # Hardlink the package into the build context when possible: docker build
+    # only reads it, and linking avoids rewriting a multi-hundred-MB file.
+    # Falls back to a copy when pkg_dir is on another filesystem.
+    deb_path = os.path.join(build_context, os.path.basename(latest_file))
+    if os.path.exists(deb_path):
+        os.remove(deb_path)
+    try:
+        os.link(latest_file, deb_path)
+    except OSError:
+        shutil.copy2(latest_file, deb_path)
 
     # Pull base image with content trust enabled
     pull_base_images(ctx, dockerfile_path, signed_pull=True)
@@ -339,8 +458,9 @@ def integration_tests(ctx, install_deps=False, race=False, remote_docker=False,
         "./test/integration/util/kubelet/...",
     ]
 
-    for prefix in prefixes:
-        ctx.run("{} {}".format(go_cmd, prefix))
+    # a single go test invocation shares the build graph between the test
+    # binaries instead of re-analyzing packages once per prefix
+    ctx.run("{} {}".format(go_cmd, " ".join(prefixes)))
 
 
 def get_omnibus_env(
@@ -398,35 +518,37 @@ def get_omnibus_env(
 
 
 def omnibus_run_task(ctx, task, target_project, base_dir, env, omnibus_s3_cache=False, log_level="info"):
-    with ctx.cd("omnibus"):
-        overrides_cmd = ""
-        if base_dir:
-            overrides_cmd = "--override=base_dir:{}".format(base_dir)
-
-        omnibus = "bundle exec omnibus"
-        if sys.platform == 'win32':
-            omnibus = "bundle exec omnibus.bat"
-        elif sys.platform == 'darwin':
-            # HACK: This is an ugly hack to fix another hack made by python3 on MacOS
-            # The full explanation is available on this PR: https://github.com/DataDog/datadog-agent/pull/5010.
-            omnibus = "unset __PYVENV_LAUNCHER__ && bundle exec omnibus"
-
-        if omnibus_s3_cache:
-            populate_s3_cache = "--populate-s3-cache"
-        else:
-            populate_s3_cache = ""
+    omnibus = "omnibus.bat" if sys.platform == 'win32' else "omnibus"
+    args = ["bundle", "exec", omnibus]
+    # task can carry extra flags (e.g. "manifest --platform=..."), split it
+    # the way the shell previously did
+    args.extend(shlex.split(task))
+    args.append(target_project)
+    args.append("--log-level={}".format(log_level))
+    if omnibus_s3_cache:
+        args.append("--populate-s3-cache")
+    if base_dir:
+        args.append("--override=base_dir:{}".format(base_dir))
 
-        cmd = "{omnibus} {task} {project_name} --log-level={log_level} {populate_s3_cache} {overrides}"
-        args = {
-            "omnibus": omnibus,
-            "task": task,
-            "project_name": target_project,
-            "log_level": log_level,
-            "overrides": overrides_cmd,
-            "populate_s3_cache": populate_s3_cache,
-        }
+    if sys.platform == 'win32':
+        # bundler and omnibus are batch files on Windows and need cmd.exe,
+        # keep going through the shell there
+        with ctx.cd("omnibus"):
+            ctx.run(subprocess.list2cmdline(args), env=env)
+        return
+
+    # Running the argv directly skips the shell spawn and parsing pass, and
+    # removes the quoting hazards of building one big command string.
+    # ctx.run merged env on top of the inherited environment; do the same here.
+    full_env = dict(os.environ, **env)
+    if sys.platform == 'darwin':
+        # HACK: This is an ugly hack to fix another hack made by python3 on MacOS,
+        # dropping the poisoned variable from the child environment instead of
+        # spawning a shell to unset it.
+        # The full explanation is available on this PR: https://github.com/DataDog/datadog-agent/pull/5010.
+        full_env.pop("__PYVENV_LAUNCHER__", None)
 
-        ctx.run(cmd.format(**args), env=env)
+    subprocess.run(args, cwd="omnibus", env=full_env, check=True)
 
 
 def bundle_install_omnibus(ctx, gem_path=None, env=None):
@@ -471,6 +593,8 @@ def omnibus_build(
     """
     Build the Agent packages with Omnibus Installer.
     """
+    import datetime
+
     deps_elapsed = None
     bundle_elapsed = None
     omnibus_elapsed = None
@@ -621,15 +745,34 @@ def check_supports_python_version(_, filename, python):
     if python not in ['2', '3']:
         raise Exit("invalid Python version", code=2)
 
-    with open(filename, 'r') as f:
-        tree = ast.parse(f.read(), filename=filename)
+    import ast
+    import mmap
+
+    # Parse straight from an mmap-ed bytes buffer instead of decoding the
+    # whole file into a str first; the parser handles utf-8 bytes natively.
+    # Empty files cannot be mmap-ed, but they parse to an empty module.
+    if os.path.getsize(filename) == 0:
+        tree = ast.parse("")
+    else:
+        with open(filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                tree = compile(bytes(mm), filename, 'exec', flags=ast.PyCF_ONLY_AST)
 
     prefix = 'Programming Language :: Python :: {}'.format(python)
+    # Only scan the keywords of top-level setup() calls instead of walking
+    # the whole tree, and stop at the first classifiers match.
     for node in ast.walk(tree):
-        if isinstance(node, ast.keyword) and node.arg == "classifiers":
-            classifiers = ast.literal_eval(node.value)
-            print(any(cls.startswith(prefix) for cls in classifiers), end="")
-            return
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        name = func.id if isinstance(func, ast.Name) else getattr(func, 'attr', None)
+        if name != "setup":
+            continue
+        for keyword in node.keywords:
+            if keyword.arg == "classifiers":
+                classifiers = ast.literal_eval(keyword.value)
+                print(any(cls.startswith(prefix) for cls in classifiers), end="")
+                return
 
 
 @task
@@ -681,6 +824,6 @@ def version(ctx, url_safe=False, omnibus_format=False, git_sha_length=7, major_v
         #   Once again, replacing tildes by dashes (+ replacing underscore by dashes if we ever end up using the second rule for some reason)
         #   in agent-release-management is enough. We're already replacing tildes by dashes in agent-release-management.
         # TODO: investigate if having one format per package type in the agent.version method makes more sense.
-        version = re.sub('-', '~', version)
-        version = re.sub(r'[^a-zA-Z0-9\.\+\:\~]+', '_', version)
+        version = OMNIBUS_VERSION_DASH_RE.sub('~', version)
+        version = OMNIBUS_VERSION_INVALID_CHAR_RE.sub('_', version)
     print(version)
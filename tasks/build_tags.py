@@ -1,6 +1,7 @@
 """
 Utilities to manage build tags
 """
+import functools
 import sys
 
 from invoke import task
@@ -132,12 +133,17 @@ def get_default_build_tags(build="agent", arch="x64"):
     The container integrations are currently only supported on Linux, disabling on
     the Windows and Darwin builds.
     """
+    return list(_default_build_tags(build, arch))
+
+
+@functools.lru_cache(maxsize=None)
+def _default_build_tags(build, arch):
     include = build_tags.get(build)
     if include is None:
         print("Warning: unrecognized build type, no build tags included.")
         include = set()
 
-    return filter_incompatible_tags(include, arch=arch)
+    return tuple(filter_incompatible_tags(include, arch=arch))
 
 
 def filter_incompatible_tags(include, arch="x64"):
@@ -165,10 +171,13 @@ def get_build_tags(include, exclude):
     the command line
     include and exclude can be lists or sets.
     """
-    # Convert parameters to sets
-    include = set(include)
-    exclude = set(exclude)
+    # Tag computation is pure, so results are memoized on the (include, exclude)
+    # pair; a fresh list is returned since some callers mutate it.
+    return list(_build_tags(frozenset(include), frozenset(exclude)))
+
 
+@functools.lru_cache(maxsize=None)
+def _build_tags(include, exclude):
     # filter out unrecognised tags
     known_include = ALL_TAGS.intersection(include)
     unknown_include = include - known_include
@@ -180,7 +189,7 @@ def get_build_tags(include, exclude):
     for tag in unknown_exclude:
         print("Warning: unknown build tag '{}' was filtered out from excluded tags list.".format(tag))
 
-    return list(known_include - known_exclude)
+    return tuple(known_include - known_exclude)
 
 
 @task
@@ -53,6 +53,29 @@ MISSPELL_IGNORED_TARGETS = [
 # Packages that need go:generate
 GO_GENERATE_TARGETS = ["./pkg/status", "./cmd/agent/gui"]
 
+# Asset directory bundled into templates.go by go:generate, per target
+GO_GENERATE_ASSETS = {
+    "./pkg/status": "templates",
+    "./cmd/agent/gui": "views",
+}
+
+
+def generate_needed():
+    """
+    Check whether any go:generate input in GO_GENERATE_TARGETS is newer than
+    the templates.go it is bundled into, i.e. whether generate must run again.
+    """
+    for target, asset_dir in GO_GENERATE_ASSETS.items():
+        generated_file = os.path.join(target, "templates.go")
+        if not os.path.exists(generated_file):
+            return True
+        generated_at = os.path.getmtime(generated_file)
+        for root, _, files in os.walk(os.path.join(target, asset_dir)):
+            for name in files:
+                if os.path.getmtime(os.path.join(root, name)) > generated_at:
+                    return True
+    return False
+
 
 @task
 def fmt(ctx, targets, fail_on_fmt=False):
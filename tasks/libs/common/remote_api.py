@@ -5,6 +5,31 @@ from invoke.exceptions import Exit
 
 errno_regex = re.compile(r".*\[Errno (\d+)\] (.*)")
 
+# Shared pooled session, created on first use
+_session = None
+
+
+def _get_session():
+    """
+    Lazily create the requests Session shared by all RemoteAPI calls.
+
+    Pooled connections with keep-alive reuse the TCP/TLS handshake across
+    requests (pagination, artifact downloads) instead of paying it per call,
+    and transient connection errors are retried with a small backoff.
+    """
+    global _session
+    if _session is None:
+        import requests
+        from urllib3.util.retry import Retry
+
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=32, pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.2)
+        )
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
 
 class RemoteAPI(object):
     """
@@ -46,6 +71,7 @@ class RemoteAPI(object):
         import requests
 
         url = self.BASE_URL + path
+        session = _get_session()
 
         # TODO: Use the param argument of requests instead of handling URL params
         # manually
@@ -54,18 +80,18 @@ class RemoteAPI(object):
             # parameter of requests.post / requests.put
             if method == "PUT":
                 if json_input:
-                    r = requests.put(url, headers=headers, json=data, stream=stream_output)
+                    r = session.put(url, headers=headers, json=data, stream=stream_output)
                 else:
-                    r = requests.put(url, headers=headers, data=data, stream=stream_output)
+                    r = session.put(url, headers=headers, data=data, stream=stream_output)
             elif method == "DELETE":
-                r = requests.delete(url, headers=headers, stream=stream_output)
+                r = session.delete(url, headers=headers, stream=stream_output)
             elif data or method == "POST":
                 if json_input:
-                    r = requests.post(url, headers=headers, json=data, stream=stream_output)
+                    r = session.post(url, headers=headers, json=data, stream=stream_output)
                 else:
-                    r = requests.post(url, headers=headers, data=data, stream=stream_output)
+                    r = session.post(url, headers=headers, data=data, stream=stream_output)
             else:
-                r = requests.get(url, headers=headers, stream=stream_output)
+                r = session.get(url, headers=headers, stream=stream_output)
             if r.status_code == 401:
                 print(self.authorization_error_message)
 
@@ -23,8 +23,8 @@ from .libs.pipeline_notifications import (
     base_message,
     find_job_owners,
     get_failed_jobs,
-    get_failed_tests,
-    send_slack_message,
+    get_failed_tests_batch,
+    send_slack_messages,
 )
 from .libs.pipeline_tools import (
     FilteredOutException,
@@ -345,7 +345,9 @@ Please check for typos in the JOBOWNERS file and/or add them to the Github <-> S
 def generate_failure_messages(base):
     project_name = "DataDog/datadog-agent"
     all_teams = "@DataDog/agent-all"
-    failed_jobs = get_failed_jobs(project_name, os.getenv("CI_PIPELINE_ID"))
+    # get_failed_jobs yields lazily; both the global message and the owner
+    # lookup below go through the jobs, so materialize them once
+    failed_jobs = list(get_failed_jobs(project_name, os.getenv("CI_PIPELINE_ID")))
     # Generate messages for each team
     messages_to_send = defaultdict(lambda: TeamMessage(base))
     messages_to_send[all_teams] = SlackMessage(base, jobs=failed_jobs)
@@ -353,11 +355,12 @@ def generate_failure_messages(base):
     failed_job_owners = find_job_owners(failed_jobs)
     for owner, jobs in failed_job_owners.items():
         if owner == "@DataDog/multiple":
-            for job in jobs:
-                for test in get_failed_tests(project_name, job):
-                    messages_to_send[all_teams].add_test_failure(test, job)
-                    for owner in test.owners:
-                        messages_to_send[owner].add_test_failure(test, job)
+            # Fetch the test artifacts of the whole batch at once so the
+            # downloads overlap instead of blocking on one job at a time
+            for job, test in get_failed_tests_batch(project_name, jobs):
+                messages_to_send[all_teams].add_test_failure(test, job)
+                for owner in test.owners:
+                    messages_to_send[owner].add_test_failure(test, job)
         elif owner == "@DataDog/do-not-notify":
             # Jobs owned by @DataDog/do-not-notify do not send team messages
             pass
@@ -447,7 +450,8 @@ def notify_failure(_, notification_type="merge", print_to_stdout=False):
         print(e)
         traceback.print_exc()
 
-    # Send messages
+    # Render and batch the messages, then flush them to Slack in one call
+    messages = []
     for owner, message in messages_to_send.items():
         channel = GITHUB_SLACK_MAP.get(owner, "#datadog-agent-pipelines")
         if owner not in GITHUB_SLACK_MAP.keys():
@@ -456,7 +460,9 @@ def notify_failure(_, notification_type="merge", print_to_stdout=False):
         if print_to_stdout:
             print("Would send to {channel}:\n{message}".format(channel=channel, message=str(message)))
         else:
-            send_slack_message(channel, str(message))  # TODO: use channel variable
+            messages.append((channel, str(message)))  # TODO: use channel variable
+    if messages:
+        send_slack_messages(messages)
 
 
 def _init_pipeline_schedule_task():
@@ -278,20 +278,22 @@ def get_git_branch_name():
     return check_output(["git", "rev-parse", "--abbrev-ref", "HEAD"]).decode('utf-8').strip()
 
 
-def query_version(ctx, git_sha_length=7, prefix=None, major_version_hint=None):
+def query_version(_, git_sha_length=7, prefix=None, major_version_hint=None):
     # The string that's passed in will look something like this: 6.0.0-beta.0-1-g4f19118
     # if the tag is 6.0.0-beta.0, it has been one commit since the tag and that commit hash is g4f19118
-    cmd = "git describe --tags --candidates=50"
+    # The git calls here are pure data fetches, so they go through subprocess
+    # directly instead of ctx.run, skipping invoke's shell and pty layering.
+    cmd = ["git", "describe", "--tags", "--candidates=50"]
     if prefix and type(prefix) == str:
-        cmd += " --match \"{}-*\"".format(prefix)
+        cmd.append("--match={}-*".format(prefix))
     else:
         if major_version_hint:
-            cmd += r' --match "{}\.*"'.format(major_version_hint)
+            cmd.append(r"--match={}\.*".format(major_version_hint))
         else:
-            cmd += " --match \"[0-9]*\""
+            cmd.append("--match=[0-9]*")
     if git_sha_length and type(git_sha_length) == int:
-        cmd += " --abbrev={}".format(git_sha_length)
-    described_version = ctx.run(cmd, hide=True).stdout.strip()
+        cmd.append("--abbrev={}".format(git_sha_length))
+    described_version = check_output(cmd).decode('utf-8').strip()
 
     # for the example above, 6.0.0-beta.0-1-g4f19118, this will be 1
     commit_number_match = re.match(r"^.*-(?P<commit_number>\d+)-g[0-9a-f]+$", described_version)
@@ -324,10 +326,9 @@ def query_version(ctx, git_sha_length=7, prefix=None, major_version_hint=None):
     # When we're on a tag, `git describe --tags --candidates=50` doesn't include a commit sha.
     # We need it, so we fetch it another way.
     if not git_sha:
-        cmd = "git rev-parse HEAD"
         # The git sha shown by `git describe --tags --candidates=50` is the first 7 characters of the sha,
         # therefore we keep the same number of characters.
-        git_sha = ctx.run(cmd, hide=True).stdout.strip()[:7]
+        git_sha = check_output(["git", "rev-parse", "HEAD"]).decode('utf-8').strip()[:7]
 
     pipeline_id = os.getenv("CI_PIPELINE_ID", None)
 